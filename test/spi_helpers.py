@@ -0,0 +1,156 @@
+# SPDX-FileCopyrightText: © 2024 Tiny Tapeout
+# SPDX-License-Identifier: Apache-2.0
+
+"""Shared SPI driver and PWM measurement helpers for the cocotb tests."""
+
+import cocotb
+from cocotb.clock import Clock
+from cocotb.triggers import ClockCycles
+from cocotb.triggers import RisingEdge
+from cocotb.triggers import Timer
+from cocotb.triggers import Edge
+from cocotb.triggers import First
+from cocotb.triggers import ReadWrite
+from cocotb.utils import get_sim_time
+
+# ui_in bit positions: {ncs, copi, sclk} on bits 2..0
+def ui_in_value(ncs, bit, sclk):
+    """Pack (ncs, copi, sclk) into a ui_in integer."""
+    return (ncs << 2) | (bit << 1) | sclk
+
+async def setup_dut(dut):
+    """Start the 10 MHz clock and reset the DUT into its idle SPI state.
+
+    This must run once per test, not once per process: cocotb kills every
+    forked task (including the clock driver) when a test ends, so a cached
+    setup would leave later tests with a dead clock."""
+    # Set the clock period to 100 ns (10 MHz)
+    clock = Clock(dut.clk, 100, units="ns")
+    cocotb.start_soon(clock.start())
+
+    dut._log.info("Reset")
+    dut.ena.value = 1
+    dut.ui_in.value = ui_in_value(1, 0, 0)  # nCS high, COPI/SCLK low
+    dut.rst_n.value = 0
+    await ClockCycles(dut.clk, 5)
+    dut.rst_n.value = 1
+    await ClockCycles(dut.clk, 5)
+
+async def _drive_spi_transaction(dut, r_w, address, data):
+    """Drive one full SPI transaction through the tb.v SPI driver,
+    leaving nCS high afterwards."""
+    # Validate inputs
+    if address < 0 or address > 127:
+        raise ValueError("Address must be 7-bit (0-127)")
+    if data < 0 or data > 255:
+        raise ValueError("Data must be 8-bit (0-255)")
+    # Combine RW, address and data into one 16-bit word, sent MSB first
+    word = (((int(r_w) << 7) | address) << 8) | data
+    # The tb.v driver produces the whole nCS/COPI/SCLK waveform; one
+    # edge wait per transaction instead of one wakeup per bit
+    dut.spi_word.value = word
+    dut.spi_go.value = 1
+    await RisingEdge(dut.spi_done)
+    dut.spi_go.value = 0
+
+async def send_spi_transaction(dut, r_w, address, data):
+    """
+    Send an SPI transaction with format:
+    - 1 bit for Read/Write
+    - 7 bits for address
+    - 8 bits for data
+
+    Parameters:
+    - r_w: boolean, True for write, False for read
+    - address: int, 7-bit address (0-127)
+    - data: int, 8-bit data
+
+    No settle time is needed afterwards: the tb.v driver holds spi_done
+    low until the peripheral has latched the transaction and its outputs
+    have updated.
+    """
+    await _drive_spi_transaction(dut, r_w, address, data)
+    return ui_in_value(1, 0, 0)
+
+async def send_spi_transactions(dut, writes):
+    """Send several SPI transactions back-to-back.
+
+    Between transactions nCS only stays high for a few clk cycles - enough
+    for the peripheral's synchronizers to latch the transaction.
+
+    Parameters:
+    - writes: list of (r_w, address, data) tuples
+    """
+    for r_w, address, data in writes[:-1]:
+        await _drive_spi_transaction(dut, r_w, address, data)
+        await ClockCycles(dut.clk, 10)
+    r_w, address, data = writes[-1]
+    await _drive_spi_transaction(dut, r_w, address, data)
+
+async def _await_out_level(signal, mask, level):
+    """Wait until the masked output bit reaches the given level (0 or 1).
+
+    Returns True once the level is seen, or False after the 1 ms timeout
+    (the same bound as the old 10000-clk-cycle polling loops)."""
+    deadline = get_sim_time(units="ns") + 1_000_000
+    while bool(int(signal.value) & mask) != bool(level):
+        remaining = deadline - get_sim_time(units="ns")
+        if remaining <= 0:
+            return False
+        timeout = Timer(remaining, units="ns")
+        if await First(Edge(signal), timeout) is timeout:
+            return False
+        # Resample after the read-write sync point so the value reflects
+        # every delta of this timestep; ReadWrite rather than ReadOnly so
+        # callers are free to drive signals as soon as we return
+        await ReadWrite()
+    return True
+
+async def measure_duty_counts(dut, periods=1):
+    """Measure the PWM duty of uo_out[0] with the tb.v monitor.
+
+    Returns (high, total) clk-cycle counts over the given number of full
+    PWM periods - exact by construction - or None if no period boundary
+    arrives within 5 ms (0%/100% duty or PWM disabled)."""
+    dut.mon_periods.value = periods
+    dut.mon_go.value = 1
+    timeout = Timer(5, units="ms")
+    result = await First(RisingEdge(dut.mon_done), timeout)
+    dut.mon_go.value = 0
+    if result is timeout:
+        return None
+    return int(dut.mon_high.value), int(dut.mon_total.value)
+
+async def edgedetections(dut, outpos = 0, outstream=0, measure_period=True):
+    #if any of these are -1 on return, means nothing was actually set
+    #Returns as a truple
+    #measure_period=False skips the wait for the second rising edge, for
+    #callers that already know the period and only need the high time
+    t_rising_edge1 = -1
+    t_falling_edge1 = -1
+    t_rising_edge2 = -1
+
+    #other variables
+    signal = dut.uo_out if outstream == 0 else dut.uio_out
+    bit = 1 << (outpos - 1)
+
+    # Wait on value changes of the output bus instead of sampling it on
+    # every clk cycle; the simulator only wakes us when an edge can have
+    # happened
+
+    #wait for drop
+    await _await_out_level(signal, bit, 0)
+
+    #wait for first rising edge
+    if await _await_out_level(signal, bit, 1):
+        t_rising_edge1 = get_sim_time(units="ns")
+
+    #wait for drop
+    if await _await_out_level(signal, bit, 0):
+        t_falling_edge1 = get_sim_time(units="ns")
+
+    #wait for next rising edge
+    if measure_period and await _await_out_level(signal, bit, 1):
+        t_rising_edge2 = get_sim_time(units="ns")
+
+    return t_rising_edge1, t_falling_edge1, t_rising_edge2
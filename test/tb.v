@@ -7,9 +7,13 @@
 module tb ();
 
   // Dump the signals to a VCD file. You can view it with gtkwave or surfer.
+  // Pass +nowaves (make WAVES=0) to skip dumping on regression runs,
+  // where writing the VCD is a large share of the wall time.
   initial begin
-    $dumpfile("tb.vcd");
-    $dumpvars(0, tb);
+    if (!$test$plusargs("nowaves")) begin
+      $dumpfile("tb.vcd");
+      $dumpvars(0, tb);
+    end
     #1;
   end
 
@@ -27,6 +31,98 @@ module tb ();
   wire VGND = 1'b0;
 `endif
 
+  // SPI master driver for test.py: the test loads a 16-bit word
+  // ({rw, addr[6:0], data[7:0]}) into spi_word and raises spi_go; the
+  // driver pulls nCS low, shifts the word out MSB-first at 100 kHz
+  // (10 us SCLK period) and raises spi_done. A whole transaction costs
+  // Python one register write and one edge wait instead of one wakeup
+  // per bit. While the driver is idle ui_in[2:0] passes straight
+  // through, so the tests can still bit-bang the SPI pins directly.
+  //
+  // The pauses around the nCS edges keep the waveform clear of the
+  // peripheral's 2FF synchronizers: data bits never race the nCS
+  // transitions, and spi_done only rises once the peripheral has had
+  // time to latch the completed transaction.
+  reg [15:0] spi_word;
+  reg        spi_go;
+  reg        spi_done;
+  reg        spi_ncs;
+  reg        spi_copi;
+  reg        spi_sclk;
+  integer    spi_i;
+
+  initial begin
+    spi_word = 0;
+    spi_go   = 0;
+    spi_done = 0;
+    spi_ncs  = 1;
+    spi_copi = 0;
+    spi_sclk = 0;
+  end
+
+  always begin
+    @(posedge spi_go);
+    spi_done = 0;
+    spi_ncs  = 0;
+    #1000;  // let the peripheral synchronize the nCS falling edge
+    for (spi_i = 15; spi_i >= 0; spi_i = spi_i - 1) begin
+      spi_copi = spi_word[spi_i];
+      #5000 spi_sclk = 1;  // peripheral samples COPI on this edge
+      #5000 spi_sclk = 0;
+    end
+    spi_copi = 0;
+    #1000;
+    spi_ncs  = 1;  // peripheral latches the transaction on this edge
+    #1000;
+    spi_done = 1;
+  end
+
+  // PWM duty monitor: test.py sets mon_periods and raises mon_go; the
+  // monitor aligns to a rising edge of uo_out[0], counts the clk cycles
+  // where the output is high and the total clk cycles over that many
+  // full PWM periods, then raises mon_done. The counts are exact, so
+  // Python gets the duty ratio from two integer reads instead of
+  // timestamping edges itself. If the output never rises (0% duty or
+  // PWM disabled) the monitor waits for the next measurement's edge;
+  // callers handle those cases without it.
+  reg        mon_go;
+  reg        mon_done;
+  reg        mon_prev;
+  reg [7:0]  mon_periods;
+  reg [7:0]  mon_count;
+  reg [31:0] mon_high;
+  reg [31:0] mon_total;
+
+  initial begin
+    mon_go      = 0;
+    mon_done    = 0;
+    mon_prev    = 0;
+    mon_periods = 1;
+    mon_count   = 0;
+    mon_high    = 0;
+    mon_total   = 0;
+  end
+
+  always begin
+    @(posedge mon_go);
+    mon_done  = 0;
+    mon_high  = 0;
+    mon_total = 0;
+    mon_count = 0;
+    @(posedge uo_out[0]);  // align to a period boundary
+    mon_prev = 1;
+    while (mon_count < mon_periods) begin
+      @(posedge clk);
+      if (uo_out[0] && !mon_prev) mon_count = mon_count + 1;
+      if (mon_count < mon_periods) begin
+        mon_total = mon_total + 1;
+        if (uo_out[0]) mon_high = mon_high + 1;
+      end
+      mon_prev = uo_out[0];
+    end
+    mon_done = 1;
+  end
+
   // Replace tt_um_example with your module name:
   tt_um_uwasic_onboarding_edson user_project (
 
@@ -36,7 +132,10 @@ module tb ();
       .VGND(VGND),
 `endif
 
-      .ui_in  (ui_in),    // Dedicated inputs
+      .ui_in  ({ui_in[7:3],             // Dedicated inputs
+                ui_in[2] & spi_ncs,     // nCS
+                ui_in[1] | spi_copi,    // COPI
+                ui_in[0] | spi_sclk}),  // SCLK
       .uo_out (uo_out),   // Dedicated outputs
       .uio_in (uio_in),   // IOs: Input path
       .uio_out(uio_out),  // IOs: Output path